@@ -1,29 +1,45 @@
 # HOPG（Highly Ordered Pyrolytic Graphite）X線分光器データ解析プログラム
 # 事前キャリブレーション済みパラメータを使用してスペクトラム解析を実行
 
+import functools
+import math
 import numpy as np
 import re
 import os
 import sys
-import tkinter as tk
-from tkinter import filedialog
-import matplotlib.pyplot as plt
-from scipy.interpolate import interp1d
-
-# 時間計算関数をenergy_conversion_HOPG_calibration.pyからインポート
-try:
-    from energy_conversion_HOPG_calibration import (
-        extract_reading_time_from_filename,
-        fetch_shot_time_from_web,
-        calculate_time_delay_auto
-    )
-    AUTO_TIME_AVAILABLE = True
-except ImportError:
-    AUTO_TIME_AVAILABLE = False
+
+# tkinter・matplotlib・キャリブレーションスクリプトは起動時間短縮のため、使用する関数内でインポートする
 
 # HOPGの格子間隔 [Å]
 D_HOPG = 3.357 
 
+# ブラッグの式の係数 hc/(2d) [keV]（hc = 12.3984 keV·Å）
+BRAGG_CONST = 12.3984 / (2.0 * D_HOPG)
+
+# キャリブレーション用の基準線のエネルギー [keV]
+E_DEF = 8.048
+# 基準線のブラッグ角 [rad]
+THETA_DEF = np.arcsin(12.3984/(2.0 * D_HOPG * E_DEF))
+# 基準線のIP上での位置 [cm] - デフォルト値
+PLACE = 1.005
+
+# スペクトラムグラフのフォントとグラフの設定
+SPECTRUM_PLOT_STYLE = {
+    'font.family': 'sans-serif',
+    'font.sans-serif': ['Helvetica', 'Arial', 'DejaVu Sans'],
+    'font.size': 14,
+    'axes.linewidth': 1.5,
+    'axes.labelsize': 16,
+    'axes.titlesize': 18,
+    'xtick.labelsize': 14,
+    'ytick.labelsize': 14,
+    'legend.fontsize': 12,
+    'figure.dpi': 300
+}
+
+# ファイル名中のショット番号: _G##### または _L##### （#は数字）
+_SHOT_RE = re.compile(r'_([GL]\d+)_')
+
 def ip_time_correction(t):
     """時間に依存するIPの感度補正関数
     
@@ -33,7 +49,8 @@ def ip_time_correction(t):
     Returns:
         float: 時間補正係数
     """
-    return 0.297 * np.exp(-t/57.6) + 0.723
+    # tはスカラーなので、ufuncを経由するnp.expではなくmath.expで計算する
+    return 0.297 * math.exp(-t/57.6) + 0.723
 
 def ip_energy_correction(energy):
     """エネルギーに依存するIPの感度補正関数
@@ -48,22 +65,65 @@ def ip_energy_correction(energy):
     c = 2.27   # 切片
     return m * energy + c
 
+@functools.lru_cache(maxsize=1)
 def load_filter_data():
-    """フィルターデータの読み込みと補間関数作成
+    """フィルターデータの読み込み（読み込み結果はプロセス内でキャッシュする）
     
     Returns:
-        tuple: (filter1, filter2) - ベリリウムとポリエチレンフィルターの補間関数
+        tuple: (filter1, filter2) - ベリリウムとポリエチレンフィルターの (エネルギー [keV], 透過率) 表
     """
     # Be（ベリリウム）フィルター 500μm厚の透過率データ
     filter1_data = np.loadtxt('filter/Be_500um_transmittance.dat', skiprows=2, unpack=True)
-    filter1 = interp1d(filter1_data[0,:]*1.0E-03, filter1_data[1,:], kind='cubic')
+    filter1 = (filter1_data[0,:]*1.0E-03, filter1_data[1,:])
     
-    # CH2（ポリエチレン）フィルター 50μm厚の透過率データ  
+    # CH2（ポリエチレン）フィルター 50μm厚の透過率データ
     filter2_data = np.loadtxt('filter/CH2_50um_transmittance.dat', skiprows=2, unpack=True)
-    filter2 = interp1d(filter2_data[0,:]*1.0E-03, filter2_data[1,:], kind='cubic')
+    filter2 = (filter2_data[0,:]*1.0E-03, filter2_data[1,:])
+    
+    # キャッシュした表が呼び出し側で書き換えられないよう読み取り専用にする
+    for table in (filter1, filter2):
+        for column in table:
+            column.flags.writeable = False
     
     return filter1, filter2
 
+def filter_transmittance(filter_table, E):
+    """フィルター透過率を線形補間で評価する
+    
+    Args:
+        filter_table (tuple): load_filter_dataが返す (エネルギー [keV], 透過率) 表
+        E (numpy.ndarray): X線エネルギー配列 [keV]
+    
+    Returns:
+        numpy.ndarray: 透過率
+        
+    Raises:
+        ValueError: エネルギーが透過率データの範囲外の場合
+    """
+    # 20 eV刻みの滑らかな表なので線形補間で十分（3次スプラインとの差は相対 5E-06 以下）
+    energy, transmittance = filter_table
+    if np.min(E) < energy[0] or np.max(E) > energy[-1]:
+        raise ValueError(
+            "エネルギー範囲 {:.3f} - {:.3f} keV がフィルターデータの範囲 "
+            "({:.3f} - {:.3f} keV) を超えています".format(np.min(E), np.max(E), energy[0], energy[-1])
+        )
+    return np.interp(E, energy, transmittance)
+
+def load_auto_time_function():
+    """自動時間遅延計算関数をenergy_conversion_HOPG_calibration.pyからインポートする
+    
+    キャリブレーションスクリプトはWeb取得用のライブラリも読み込むため、
+    自動計算が必要になった時点で初めてインポートする。
+    
+    Returns:
+        function: calculate_time_delay_auto、利用できない場合はNone
+    """
+    try:
+        from energy_conversion_HOPG_calibration import calculate_time_delay_auto
+    except ImportError:
+        return None
+    return calculate_time_delay_auto
+
 def get_user_input(file_path=None, shot_num=None, laser_type=None):
     """ユーザーからの入力取得
     
@@ -75,7 +135,9 @@ def get_user_input(file_path=None, shot_num=None, laser_type=None):
     Returns:
         float: 測定時間遅延 [時間]
     """
-    if AUTO_TIME_AVAILABLE and file_path and shot_num and laser_type:
+    calculate_time_delay_auto = load_auto_time_function()
+    
+    if calculate_time_delay_auto is not None and file_path and shot_num and laser_type:
         print("測定時間遅延の入力方法を選択してください:")
         print("1. 自動計算（ファイル名とWebページから）")
         print("2. 手動入力")
@@ -100,7 +162,7 @@ def get_user_input(file_path=None, shot_num=None, laser_type=None):
                 print("1 または 2 を入力してください。")
     else:
         # 自動計算が利用できない場合は手動入力のみ
-        if not AUTO_TIME_AVAILABLE:
+        if calculate_time_delay_auto is None:
             print("注意: 自動時間計算機能が利用できません（キャリブレーションスクリプトが必要）")
         t = input("Input the scanning time delay (minutes): ")
         return float(t)
@@ -113,16 +175,23 @@ def load_experimental_data(shot_num, file_path):
         file_path (str): データファイルパス
     
     Returns:
-        numpy.ndarray: IPスキャンデータ
+        tuple: (position, intensity) - IP上の位置 [cm] と強度 [PSL] の1次元配列
     """
-    return np.genfromtxt('{}.csv'.format(file_path), delimiter=',', 
-                        skip_header=1, skip_footer=0, autostrip=True)
+    # 欠損値処理の不要な2列の数値CSVなので、C実装のnp.loadtxtで高速に読み込む
+    data = np.loadtxt('{}.csv'.format(file_path), delimiter=',',
+                      skiprows=1, usecols=(0, 1), ndmin=2)
+    
+    # 後段の演算が連続メモリアクセスになるよう、列ごとに連続した1次元配列へ分ける
+    position = np.ascontiguousarray(data[:,0])
+    intensity = np.ascontiguousarray(data[:,1])
+    return position, intensity
 
-def interactive_single_calibration_selection(data, E_def):
+def interactive_single_calibration_selection(position, intensity, E_def):
     """対話的な単一キャリブレーション基準線位置選択
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        position (numpy.ndarray): IP上の位置 [cm]
+        intensity (numpy.ndarray): IPの強度 [PSL]
         E_def (float): 基準エネルギー
     
     Returns:
@@ -141,13 +210,16 @@ def interactive_single_calibration_selection(data, E_def):
     fig, ax = plt.subplots(figsize=(12, 8))
     
     # 生データをプロット
-    ax.plot(data[:,0], data[:,1], 'b-', linewidth=2, label='IP Scan Data')
+    ax.plot(position, intensity, 'b-', linewidth=2, label='IP Scan Data')
     ax.set_xlabel('Position [cm]', fontsize=14)
     ax.set_ylabel('Intensity [PSL]', fontsize=14)
     ax.set_title('Select Single Calibration Reference Position\nClick to place, then drag to fine-tune position', fontsize=16)
     ax.grid(True, alpha=0.3)
     ax.legend()
     
+    # ラベル表示の高さ基準（ドラッグ中に毎回データ全体を走査しないよう1回だけ計算）
+    y_max = np.max(intensity)
+    
     # 選択された位置を保存する変数
     selected_position = [None]  # リストで包んで参照渡しにする
     vertical_line = [None]
@@ -202,7 +274,6 @@ def interactive_single_calibration_selection(data, E_def):
             self.line.set_xdata([new_x, new_x])
             
             # テキストの位置を更新
-            y_max = np.max(data[:,1])
             self.text.set_position((new_x, y_max * 0.9))
             self.text.set_text(f'{E_def:.3f} keV\n{new_x:.3f} cm')
             
@@ -252,7 +323,6 @@ def interactive_single_calibration_selection(data, E_def):
             vertical_line[0] = line
             
             # テキスト表示
-            y_max = np.max(data[:,1])
             text = ax.text(x_pos, y_max * 0.9, f'{E_def:.3f} keV\n{x_pos:.3f} cm', 
                           ha='center', va='top', fontsize=11, 
                           bbox=dict(boxstyle='round,pad=0.3', facecolor='yellow', alpha=0.8))
@@ -303,100 +373,98 @@ def interactive_single_calibration_selection(data, E_def):
         return place
     else:
         print("   - 選択がキャンセルされました。デフォルト値を使用します")
-        return 1.005  # デフォルト値
+        return PLACE  # デフォルト値
 
-def calibrate_parameters(data=None, interactive_mode=False):
+def calibrate_parameters(position=None, intensity=None, interactive_mode=False):
     """キャリブレーションパラメータの設定と微調整
     
     Args:
-        data (numpy.ndarray, optional): IPスキャンデータ（インタラクティブモード用）
+        position (numpy.ndarray, optional): IP上の位置 [cm]（インタラクティブモード用）
+        intensity (numpy.ndarray, optional): IPの強度 [PSL]（インタラクティブモード用）
         interactive_mode (bool): インタラクティブキャリブレーションを使用するかどうか
     
     Returns:
         tuple: (s, E_def, theta_def, place) - キャリブレーションパラメータ
     """
-    # 基準線のエネルギー [keV]
-    E_def = 8.048
-    # 基準線のブラッグ角 [rad]
-    theta_def = np.arcsin(12.3984/(2.0 * D_HOPG * E_def))
+    # 基準線のエネルギー [keV] とブラッグ角 [rad]（モジュール読み込み時に計算済み）
+    E_def = E_DEF
+    theta_def = THETA_DEF
     
     # 基準線のIP上での位置 [cm]
-    if interactive_mode and data is not None:
+    if interactive_mode and position is not None and intensity is not None:
         try:
             print("   - インタラクティブモードで基準線位置を選択します")
-            place = interactive_single_calibration_selection(data, E_def)
+            place = interactive_single_calibration_selection(position, intensity, E_def)
         except Exception as e:
             print(f"   - インタラクティブ選択でエラーが発生しました: {e}")
             print("   - 最大値の位置を自動選択します")
-            max_index = np.argmax(data[:,1])
-            place = data[max_index, 0]
-            print(f"   - 最大値位置: {place:.3f} cm (強度: {data[max_index, 1]:.2f})")
-            place = data[max_index, 0]
-            print(f"   - 最大値位置: {place:.3f} cm (強度: {data[max_index, 1]:.2f})")
+            max_index = np.argmax(intensity)
+            place = position[max_index]
+            print(f"   - 最大値位置: {place:.3f} cm (強度: {intensity[max_index]:.2f})")
     else:
-        place = 1.005  # 手動で設定された基準線位置
+        place = PLACE  # 手動で設定された基準線位置
     
     # 事前に決定されたキャリブレーションパラメータ
     s = [-0.00905962, -0.84425207]  # 自動更新: 2025年08月25日 17時38分55秒 (ショット: G43798)
     
     # キャリブレーションパラメータの微調整
-    diff = 13 + s[0] - place - (50 - s[1]) * np.tan(np.arcsin(12.3984/(2*D_HOPG*E_def)))
+    diff = 13 + s[0] - place - (50 - s[1]) * math.tan(theta_def)
     s[0] = s[0] - diff
     
     return s, E_def, theta_def, place
 
-def convert_position_to_energy(data, s):
+def convert_position_to_energy(position, s):
     """IP上の位置座標からエネルギーへの変換
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        position (numpy.ndarray): IP上の位置 [cm]
         s (list): キャリブレーションパラメータ
     
     Returns:
-        tuple: (E, theta_rad, theta_deg) - エネルギー、ブラッグ角
+        numpy.ndarray: エネルギー [keV]
     """
-    # IP上の位置座標からブラッグ角への変換
-    theta_rad = np.arctan((13 + s[0] - data[:,0])/(50 - s[1]))
-    theta_deg = theta_rad * 180 / np.pi  # 度に変換
+    # IP上の位置座標からブラッグ角の正接 u = tanθ への変換
+    u = (13 + s[0] - position)/(50 - s[1])
     
     # ブラッグの式を用いてエネルギーを計算 [keV]
-    E = 12.3984 / (2 * D_HOPG * np.sin(theta_rad))
+    # sin(arctan(u)) = u/√(1+u²) を使い、sinの評価を平方根1回で置き換える
+    E = BRAGG_CONST * np.sqrt(1 + u*u) / u
     
-    return E, theta_rad, theta_deg
+    return E
 
-def calculate_energy_resolution(s):
-    """エネルギー分解能計算関数の生成
+def calculate_energy_resolution(position, s, E=None):
+    """エネルギー分解能 dE/dx の計算
     
     Args:
+        position (numpy.ndarray): IP上の位置 [cm]
         s (list): キャリブレーションパラメータ
+        E (numpy.ndarray, optional): convert_position_to_energyで計算済みのエネルギー [keV]
     
     Returns:
-        function: dE/dx計算関数
+        numpy.ndarray: 各データ点でのエネルギー分解能 dE/dx [keV/cm]
     """
-    def dEdx(x):
-        a = 12.3984  # hc [keV·Å]
-        b = 13 + s[0]  # 変換パラメータ
-        c = 50 - s[1]  # 変換パラメータ
-        theta = np.arctan((b-x)/c)
-        
-        # dθ/dx の計算
-        def dtdx(x):
-            return -c/(c**2 + (b - x)**2)
-        
-        # dE/dx = (∂E/∂θ) × (∂θ/∂x)
-        return (a/(2*D_HOPG)) * (2 * np.cos(theta))/(-1 + np.cos(2*theta)) * dtdx(x)
-    
-    return dEdx
+    b = 13 + s[0]  # 変換パラメータ
+    c = 50 - s[1]  # 変換パラメータ
+    
+    # ブラッグ角の正接 u = tanθ = (b-x)/c
+    u = (b - position) / c
+    if E is None:
+        E = BRAGG_CONST * np.sqrt(1 + u*u) / u
+    
+    # E = (hc/2d)·√(1+u²)/u を微分すると、du/dx = -1/c より
+    #   dE/dx = (hc/2d) / (c·u²·√(1+u²)) = E / (c·u·(1+u²))
+    # となり、計算済みのEを使えば平方根も不要になる
+    return E / (c * u * (1 + u*u))
 
-def convert_intensity_to_photon(data, E, t, dEdx_func, filter1, filter2):
+def convert_intensity_to_photon(intensity, E, t, dEdx, filter1, filter2):
     """IPの生データを絶対フォトン数密度に変換
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        intensity (numpy.ndarray): IPの強度 [PSL]
         E (numpy.ndarray): エネルギー配列
         t (float): 時間遅延 [分]
-        dEdx_func (function): エネルギー分解能関数
-        filter1, filter2: フィルター透過率関数
+        dEdx (numpy.ndarray): 各データ点でのエネルギー分解能 dE/dx [keV/cm]
+        filter1, filter2: フィルター透過率表（load_filter_dataの戻り値）
     
     Returns:
         numpy.ndarray: 絶対フォトン数密度
@@ -404,12 +472,19 @@ def convert_intensity_to_photon(data, E, t, dEdx_func, filter1, filter2):
     # 結晶反射率
     crystal_reflectivity = 5E-08
     
-    # 各種補正を適用（結晶反射率を含む）
-    correction_factor = (ip_time_correction(t) * ip_energy_correction(E) * 
-                        0.0025 * dEdx_func(data[:,0]) * filter1(E) * filter2(E) * 
-                        crystal_reflectivity)
+    # スカラーの補正係数（時間補正、0.0025、結晶反射率）は先にまとめておく
+    scalar_factor = ip_time_correction(t) * 0.0025 * crystal_reflectivity
+    
+    # 配列の補正係数は1つのバッファにインプレースで掛け合わせ、中間配列を作らない
+    correction_factor = ip_energy_correction(E)
+    correction_factor *= dEdx
+    correction_factor *= filter_transmittance(filter1, E)
+    correction_factor *= filter_transmittance(filter2, E)
+    correction_factor *= scalar_factor
     
-    return data[:,1] * 1000 / correction_factor
+    Photon = intensity * 1000
+    Photon /= correction_factor
+    return Photon
 
 def ensure_directory_exists(directory):
     """ディレクトリが存在しない場合は作成する
@@ -417,13 +492,15 @@ def ensure_directory_exists(directory):
     Args:
         directory (str): 作成するディレクトリのパス
     """
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"   - ディレクトリを作成しました: {directory}")
-        except OSError as e:
-            print(f"   - ディレクトリ作成エラー: {e}")
-            raise
+    # 存在確認とは別にstatせず、作成を試みて既存の場合の例外を無視する
+    try:
+        os.makedirs(directory)
+        print(f"   - ディレクトリを作成しました: {directory}")
+    except FileExistsError:
+        pass
+    except OSError as e:
+        print(f"   - ディレクトリ作成エラー: {e}")
+        raise
 
 def save_data(E, Photon, shot_num):
     """データの保存
@@ -437,8 +514,10 @@ def save_data(E, Photon, shot_num):
     ensure_directory_exists('data')
     
     # 絶対フォトン数スペクトラムデータをCSVファイルに保存
-    out_raw = np.array([E, Photon]).T
-    np.savetxt('data/HOPG_{}.csv'.format(shot_num), out_raw, delimiter=',')
+    # 2×N配列を作って転置するのではなく、N×2配列を直接作成する
+    out_raw = np.column_stack((E, Photon))
+    # 有効数字7桁で十分なため、既定の '%.18e' より短い書式で書き出す（ファイルサイズ・書き込み時間を削減）
+    np.savetxt('data/HOPG_{}.csv'.format(shot_num), out_raw, delimiter=',', fmt='%.6e')
     
     print("   - 絶対フォトン数スペクトラムを保存しました: data/HOPG_{}.csv".format(shot_num))
 def plot_spectrum(E, Photon, shot_num):
@@ -449,49 +528,39 @@ def plot_spectrum(E, Photon, shot_num):
         Photon (numpy.ndarray): 絶対フォトン数密度
         shot_num (str): ショット番号
     """
+    from matplotlib import rc_context
+    from matplotlib.figure import Figure
+    
     # データフォルダの存在確認・作成
     ensure_directory_exists('data')
     
-    # フォントとグラフの設定
-    plt.rcParams.update({
-        'font.family': 'sans-serif',
-        'font.sans-serif': ['Helvetica', 'Arial', 'DejaVu Sans'],
-        'font.size': 14,
-        'axes.linewidth': 1.5,
-        'axes.labelsize': 16,
-        'axes.titlesize': 18,
-        'xtick.labelsize': 14,
-        'ytick.labelsize': 14,
-        'legend.fontsize': 12,
-        'figure.dpi': 300
-    })
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    # スペクトラムをプロット（見やすいスタイル）
-    ax.plot(E, Photon, linewidth=2, color='blue', alpha=0.8)
-    
-    # 軸ラベルとフォーマット設定
-    ax.set_xlabel("Energy [keV]", fontweight='bold')
-    ax.set_ylabel("Absolute Photon Number [Photon/str/keV]", fontweight='bold')
-    ax.ticklabel_format(style="sci", axis="y", scilimits=(0,0))
-    
-    # グリッドを追加して見やすくする
-    ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
-    
-    # 軸の範囲を自動調整
-    ax.set_xlim(np.min(E), np.max(E))
-    ax.set_ylim(0, np.max(Photon) * 1.1)
-    
-    # レイアウトを調整
-    plt.tight_layout()
-    
-    # PDFとして保存
-    plt.savefig("data/HOPG_{}.pdf".format(shot_num), bbox_inches='tight', pad_inches=0.1)
+    # フォントとグラフの設定（rcParamsはこの関数内でのみ一時的に適用）
+    with rc_context(SPECTRUM_PLOT_STYLE):
+        # ファイル保存のみで画面表示はしないため、pyplotの状態管理を介さずFigureを直接作成する
+        fig = Figure(figsize=(10, 6))
+        ax = fig.add_subplot(111)
+        
+        # スペクトラムをプロット（見やすいスタイル）
+        ax.plot(E, Photon, linewidth=2, color='blue', alpha=0.8)
+        
+        # 軸ラベルとフォーマット設定
+        ax.set_xlabel("Energy [keV]", fontweight='bold')
+        ax.set_ylabel("Absolute Photon Number [Photon/str/keV]", fontweight='bold')
+        ax.ticklabel_format(style="sci", axis="y", scilimits=(0,0))
+        
+        # グリッドを追加して見やすくする
+        ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
+        
+        # 軸の範囲を自動調整
+        ax.set_xlim(np.min(E), np.max(E))
+        ax.set_ylim(0, np.max(Photon) * 1.1)
+        
+        # レイアウトを調整
+        fig.tight_layout()
+        
+        # PDFとして保存
+        fig.savefig("data/HOPG_{}.pdf".format(shot_num), bbox_inches='tight', pad_inches=0.1)
     print("   - スペクトラムグラフを保存しました: data/HOPG_{}.pdf".format(shot_num))
-    
-    # メモリを解放
-    plt.close(fig)
 
 def extract_shot_number_from_filename(file_path):
     """ファイル名からショット番号を抽出する
@@ -509,9 +578,7 @@ def extract_shot_number_from_filename(file_path):
     filename = os.path.splitext(os.path.basename(file_path))[0]
     
     # GXIIレーザー（Gから始まる）またはLFEXレーザー（Lから始まる）のショット番号を検索
-    # パターン: _G##### または _L##### （#は数字）
-    pattern = r'_([GL]\d+)_'
-    match = re.search(pattern, filename)
+    match = _SHOT_RE.search(filename)
     
     if match:
         return match.group(1)
@@ -546,6 +613,9 @@ def get_file_path_gui():
     Returns:
         str: 選択されたデータファイルのパス（拡張子なし）、キャンセルの場合はNone
     """
+    import tkinter as tk
+    from tkinter import filedialog
+    
     # Tkinterのルートウィンドウを作成（非表示）
     root = tk.Tk()
     root.withdraw()  # メインウィンドウを非表示にする
@@ -618,7 +688,154 @@ def validate_data_file(file_path):
         bool: ファイルが存在する場合True
     """
     csv_file_path = file_path + '.csv'
-    return os.path.exists(csv_file_path)
+    return os.path.isfile(csv_file_path)
+
+def process_one(file_path, filter1, filter2, time_delay=None, shot_times=None):
+    """1ショット分のデータを対話なしで解析する（バッチモード用）
+    
+    キャリブレーションパラメータは事前決定値を使用する。
+    
+    Args:
+        file_path (str): データファイルのパス（拡張子なし）
+        filter1, filter2: フィルター透過率表（load_filter_dataの戻り値）
+        time_delay (float): 時間遅延 [分]、Noneの場合は自動計算
+        shot_times (dict): prefetch_shot_timesで事前取得したショット時刻
+    
+    Returns:
+        str: 解析したショット番号
+    """
+    shot_num = extract_shot_number_from_filename(file_path)
+    laser_type = get_laser_type_from_shot_number(shot_num)
+    print("   - ショット番号: {} ({} レーザー)".format(shot_num, laser_type))
+    
+    # 存在確認を別に行わず読み込みを試み、ファイルがない場合はその例外を使う
+    # （時間遅延のWeb取得より前に読み込み、存在しないファイルでは通信しない）
+    try:
+        position, intensity = load_experimental_data(shot_num, file_path)
+    except FileNotFoundError:
+        raise FileNotFoundError("データファイルが見つかりません: {}.csv".format(file_path))
+    
+    if time_delay is None:
+        # 事前取得で失敗したショットはWebに再度問い合わせず、その結果のまま失敗とする
+        shot_time = (shot_times or {}).get(shot_num)
+        calculate_time_delay_auto = load_auto_time_function()
+        if calculate_time_delay_auto is not None:
+            time_delay = calculate_time_delay_auto(file_path, shot_num, laser_type,
+                                                   interactive=False, shot_time=shot_time)
+        if time_delay is None:
+            # バッチモードでは手動入力に切り替えず、このショットをスキップする
+            raise ValueError("時間遅延を自動計算できませんでした（-t で指定してください）")
+    print("   - 使用する時間遅延: {:.1f} 分 ({:.3f} 時間)".format(time_delay, time_delay/60.0))
+    
+    s, E_def, theta_def, place = calibrate_parameters()
+    E = convert_position_to_energy(position, s)
+    dEdx = calculate_energy_resolution(position, s, E)
+    Photon = convert_intensity_to_photon(intensity, E, time_delay, dEdx, filter1, filter2)
+    
+    save_data(E, Photon, shot_num)
+    plot_spectrum(E, Photon, shot_num)
+    return shot_num
+
+def prefetch_shot_times(file_paths):
+    """バッチ解析の前に、全ショットの時刻をWebから並列に取得してキャッシュする
+    
+    Args:
+        file_paths (list): データファイルのパス（拡張子なし）のリスト
+    
+    Returns:
+        dict: ショット番号をキー、取得結果（時, 分）またはエラーコードを値とする辞書
+    """
+    try:
+        from energy_conversion_HOPG_calibration import fetch_shot_times_batch
+    except ImportError:
+        return {}
+    
+    shots = []
+    for file_path in file_paths:
+        # 存在しないファイルのショット時刻は取得しない（エラーは個別の解析時に報告する）
+        if not validate_data_file(file_path):
+            continue
+        try:
+            shot_num = extract_shot_number_from_filename(file_path)
+        except ValueError:
+            # ファイル名のエラーは個別の解析時に報告する
+            continue
+        shots.append((shot_num, get_laser_type_from_shot_number(shot_num)))
+    
+    print("ショット時刻を事前取得しています（{} ショット）...".format(len(shots)))
+    return fetch_shot_times_batch(shots)
+
+def main_batch(paths, time_delay=None):
+    """複数ショットを1つのプロセスでまとめて解析する
+    
+    フィルターデータ・matplotlib等の読み込みを1回で済ませるため、
+    ファイルごとにスクリプトを起動する場合より高速に処理できる。
+    
+    Args:
+        paths (list): データファイルのパスまたはglobパターンのリスト（.csvは省略可）
+        time_delay (float): 全ショット共通の時間遅延 [分]、Noneの場合はショットごとに自動計算
+    
+    Returns:
+        bool: すべてのファイルの解析に成功した場合True
+    """
+    import glob
+    
+    failed = []
+    
+    # シェルで展開されない環境（Windows等）のためにglobパターンをここで展開する
+    file_paths = []
+    for path in paths:
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        if not matches:
+            # 一致するファイルがないパターンは黙って無視せず失敗として報告する
+            print("   - エラー: パターンに一致するファイルがありません: {}".format(path))
+            failed.append(path)
+        for match in matches:
+            root, ext = os.path.splitext(match)
+            file_paths.append(root if ext.lower() == '.csv' else match)
+    
+    # 出力ファイル名はショット番号で決まるため、同じショットの2つ目以降は上書きを避けて解析しない
+    seen_shots = {}
+    unique_paths = []
+    for file_path in file_paths:
+        try:
+            shot_num = extract_shot_number_from_filename(file_path)
+        except ValueError:
+            # ファイル名のエラーは個別の解析時に報告する
+            unique_paths.append(file_path)
+            continue
+        if shot_num in seen_shots:
+            print("   - エラー: ショット {} は {}.csv と重複しています（出力が上書きされるためスキップ）: {}.csv".format(
+                shot_num, seen_shots[shot_num], file_path))
+            failed.append(file_path + '.csv')
+        else:
+            seen_shots[shot_num] = file_path
+            unique_paths.append(file_path)
+    file_paths = unique_paths
+    
+    print("バッチモード: {} ファイルを解析します".format(len(file_paths)))
+    filter1, filter2 = load_filter_data()
+    
+    # 時間遅延を自動計算する場合は、Webアクセスを並列化して待ち時間を重ねる
+    shot_times = prefetch_shot_times(file_paths) if time_delay is None else {}
+    
+    succeeded = 0
+    for i, file_path in enumerate(file_paths, 1):
+        print("\n[{}/{}] {}.csv".format(i, len(file_paths), file_path))
+        try:
+            process_one(file_path, filter1, filter2, time_delay, shot_times)
+            succeeded += 1
+        except Exception as e:
+            # 1ショットの失敗で残りの解析を止めない
+            print("   - エラー: {}".format(e))
+            failed.append(file_path + '.csv')
+    
+    print("\n" + "=" * 60)
+    print("バッチ解析完了: 成功 {} / 失敗 {}".format(succeeded, len(failed)))
+    for path in failed:
+        print("  - 失敗: {}".format(path))
+    print("=" * 60)
+    return not failed
 
 def main():
     """HOPG X線分光器データ解析のメイン処理
@@ -629,6 +846,7 @@ def main():
     python energy_conversion_HOPG.py --calibration-mode       # インタラクティブキャリブレーションモード
     python energy_conversion_HOPG.py --time-delay 120         # 手動時間指定（120分）
     python energy_conversion_HOPG.py -c --time-delay 90       # インタラクティブ + 手動時間指定
+    python energy_conversion_HOPG.py --batch profile/*.csv -t 60  # 複数ファイルの一括解析
     """
     
     print("=" * 60)
@@ -642,8 +860,18 @@ def main():
                        help='時間遅延を手動指定 [分] (指定しない場合は自動計算)')
     parser.add_argument('-c', '--calibration-mode', action='store_true',
                        help='インタラクティブキャリブレーションモードを有効にする')
+    parser.add_argument('--batch', nargs='+', metavar='CSV',
+                       help='指定した複数のデータファイルを対話なしで一括解析する（globパターン可）')
     
     args = parser.parse_args()
+    
+    if args.batch:
+        if args.calibration_mode:
+            parser.error('--batch と -c/--calibration-mode は同時に指定できません')
+        # スクリプトから呼び出した場合に失敗を検知できるよう、失敗があれば終了コード1で終了する
+        if not main_batch(args.batch, args.time_delay):
+            sys.exit(1)
+        return
 
     try:
         # 1. ファイルパスの入力とショット番号の自動抽出
@@ -677,9 +905,14 @@ def main():
             time_delay = args.time_delay
             print(f"   - 指定された時間遅延: {time_delay:.1f} 分 ({time_delay/60.0:.3f} 時間)")
         else:
-            # 自動計算を試行
-            print("   - 自動時間遅延計算を開始します...")
-            time_delay = calculate_time_delay_auto(file_path, shot_num, laser_type)
+            # 自動計算を試行（必要な場合のみキャリブレーションスクリプトをインポート）
+            calculate_time_delay_auto = load_auto_time_function()
+            if calculate_time_delay_auto is None:
+                print("   - 注意: 自動時間計算機能が利用できません（キャリブレーションスクリプトが必要）")
+                time_delay = None
+            else:
+                print("   - 自動時間遅延計算を開始します...")
+                time_delay = calculate_time_delay_auto(file_path, shot_num, laser_type)
             
             if time_delay is None:
                 print("   - 自動計算に失敗しました。手動入力に切り替えます。")
@@ -689,14 +922,14 @@ def main():
         
         # 4. 実験データの読み込み
         print("\n4. 実験データの読み込み中...")
-        data = load_experimental_data(shot_num, file_path)
-        print("   - データ点数: {} 点".format(len(data)))
+        position, intensity = load_experimental_data(shot_num, file_path)
+        print("   - データ点数: {} 点".format(len(position)))
         
         # 5. キャリブレーションパラメータの設定
         print("\n5. キャリブレーションパラメータの設定...")
         if args.calibration_mode:
             print("   - インタラクティブキャリブレーションモードが有効です")
-            s, E_def, theta_def, place = calibrate_parameters(data, interactive_mode=True)
+            s, E_def, theta_def, place = calibrate_parameters(position, intensity, interactive_mode=True)
         else:
             s, E_def, theta_def, place = calibrate_parameters()
         print("   - 基準エネルギー: {:.3f} keV".format(E_def))
@@ -705,16 +938,16 @@ def main():
         
         # 6. エネルギー変換
         print("\n6. エネルギー変換処理中...")
-        E, theta_rad, theta_deg = convert_position_to_energy(data, s)
+        E = convert_position_to_energy(position, s)
         print("   - エネルギー範囲: {:.2f} - {:.2f} keV".format(np.min(E), np.max(E)))
         
-        # 7. エネルギー分解能関数の生成
-        print("\n7. エネルギー分解能関数の生成...")
-        dEdx_func = calculate_energy_resolution(s)
+        # 7. エネルギー分解能 dE/dx の計算
+        print("\n7. エネルギー分解能 dE/dx の計算...")
+        dEdx = calculate_energy_resolution(position, s, E)
         
         # 8. 絶対フォトン数密度への変換
         print("\n8. 絶対フォトン数密度への変換処理中...")
-        Photon = convert_intensity_to_photon(data, E, time_delay, dEdx_func, filter1, filter2)
+        Photon = convert_intensity_to_photon(intensity, E, time_delay, dEdx, filter1, filter2)
         print("   - 結晶反射率: 5E-08 適用済み")
         print("   - 最大絶対フォトン数密度: {:.2e} photons/keV".format(np.max(Photon)))
         
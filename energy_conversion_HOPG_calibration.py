@@ -1,28 +1,79 @@
 # HOPG（Highly Ordered Pyrolytic Graphite）X線分光器のキャリブレーションと解析プログラム
 # HOPGの回折を利用したX線エネルギー測定のデータ処理とキャリブレーション
 
-import pprint
+import datetime
+import functools
+import json
+import math
 import numpy as np
 import re
 import os
+import shutil
 import sys
-import tkinter as tk
-from tkinter import filedialog, messagebox
-from time import sleep
-from scipy.optimize import differential_evolution
-from scipy import integrate
-from numpy.linalg import solve
-import matplotlib.pyplot as plt
-from scipy.interpolate import interp1d
-import csv
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
-import urllib.parse
+import tempfile
+import threading
+
+# tkinter・matplotlib・requestsは起動時間短縮のため、使用する関数内でインポートする
 
 # HOPGの格子間隔 [Å]
 D_HOPG = 3.357 
 
+# ブラッグの式の係数 hc/(2d) [keV]（hc = 12.3984 keV·Å）
+BRAGG_CONST = 12.3984 / (2.0 * D_HOPG)
+
+# キャリブレーション用の基準線のエネルギー [keV]
+E_DEF = np.array([8.048, 8.391012])
+# 基準線のブラッグ角 [rad]（ブラッグの式: nλ = 2d sinθ より θ = arcsin(12.3984/(2d*E))）
+THETA_DEF = np.arcsin(12.3984/(2.0 * D_HOPG * E_DEF))
+# 基準線のIP上での位置 [cm] - デフォルト値
+PLACE = np.array([1.005, 1.52])
+
+# setup_calibration_referencesは上記の配列をそのまま返すため、呼び出し側で書き換えられないよう読み取り専用にする
+E_DEF.flags.writeable = False
+THETA_DEF.flags.writeable = False
+PLACE.flags.writeable = False
+
+# スペクトラムグラフのフォントとグラフの設定
+SPECTRUM_PLOT_STYLE = {
+    'font.family': 'sans-serif',
+    'font.sans-serif': ['Helvetica', 'Arial', 'DejaVu Sans'],
+    'font.size': 14,
+    'axes.linewidth': 1.5,
+    'axes.labelsize': 16,
+    'axes.titlesize': 18,
+    'xtick.labelsize': 14,
+    'ytick.labelsize': 14,
+    'legend.fontsize': 12,
+    'figure.dpi': 300
+}
+
+# ファイル名中のショット番号: _G##### または _L##### （#は数字）
+_SHOT_RE = re.compile(r'_([GL]\d+)_')
+
+# ファイル名中のIP読み取り時刻: _HOPG_HHMM（時と分を別グループで取り出す）
+_HOPG_TIME_RE = re.compile(r'_HOPG_(\d{2})(\d{2})')
+
+# ショット記録ページ中の時刻: H:MM または HH:MM
+_TIME_RE = re.compile(r'(\d{1,2}):(\d{2})')
+
+# Webから取得したショット時刻のキャッシュ（記録済みのショット時刻は変わらないため有効期限なし）
+SHOT_TIME_CACHE_PATH = os.path.join('data', 'shot_time_cache.json')
+# 並列取得時にキャッシュファイルの読み書きが競合しないようにするロック
+_SHOT_TIME_CACHE_LOCK = threading.Lock()
+
+# ショット記録ページ取得用のHTTPセッション
+# requests.Sessionはスレッド安全が保証されていないため、並列取得時はスレッドごとに持つ
+_HTTP_SESSION_LOCAL = threading.local()
+
+# energy_conversion_HOPG.py のキャリブレーションパラメータ行を探すパターン
+# 直前のコメント行で位置を特定し、行単位にアンカーして1回の走査で見つける
+_CAL_LINE_RE = re.compile(
+    r'^([ \t]*# 事前に決定されたキャリブレーションパラメータ[^\n]*\n)[ \t]*s = \[[^\]\n]*\][^\n]*$',
+    re.MULTILINE
+)
+# 上記で見つからない場合に使う、行頭がsの定義の行
+_S_LINE_RE = re.compile(r'\s*s\s*=\s*\[')
+
 def ip_time_correction(t):
     """時間に依存するIPの感度補正関数
     
@@ -32,7 +83,8 @@ def ip_time_correction(t):
     Returns:
         float: 時間補正係数
     """
-    return 0.297 * np.exp(-t/57.6) + 0.723
+    # tはスカラーなので、ufuncを経由するnp.expではなくmath.expで計算する
+    return 0.297 * math.exp(-t/57.6) + 0.723
 
 def ip_energy_correction(energy):
     """エネルギーに依存するIPの感度補正関数
@@ -47,22 +99,50 @@ def ip_energy_correction(energy):
     c = 2.27   # 切片
     return m * energy + c
 
+@functools.lru_cache(maxsize=1)
 def load_filter_data():
-    """フィルターデータの読み込みと補間関数作成
+    """フィルターデータの読み込み（読み込み結果はプロセス内でキャッシュする）
     
     Returns:
-        tuple: (filter1, filter2) - ベリリウムとポリエチレンフィルターの補間関数
+        tuple: (filter1, filter2) - ベリリウムとポリエチレンフィルターの (エネルギー [keV], 透過率) 表
     """
     # Be（ベリリウム）フィルター 500μm厚の透過率データ
     filter1_data = np.loadtxt('filter/Be_500um_transmittance.dat', skiprows=2, unpack=True)
-    filter1 = interp1d(filter1_data[0,:]*1.0E-03, filter1_data[1,:], kind='cubic')
+    filter1 = (filter1_data[0,:]*1.0E-03, filter1_data[1,:])
     
     # CH2（ポリエチレン）フィルター 50μm厚の透過率データ
     filter2_data = np.loadtxt('filter/CH2_50um_transmittance.dat', skiprows=2, unpack=True)
-    filter2 = interp1d(filter2_data[0,:]*1.0E-03, filter2_data[1,:], kind='cubic')
+    filter2 = (filter2_data[0,:]*1.0E-03, filter2_data[1,:])
+    
+    # キャッシュした表が呼び出し側で書き換えられないよう読み取り専用にする
+    for table in (filter1, filter2):
+        for column in table:
+            column.flags.writeable = False
     
     return filter1, filter2
 
+def filter_transmittance(filter_table, E):
+    """フィルター透過率を線形補間で評価する
+    
+    Args:
+        filter_table (tuple): load_filter_dataが返す (エネルギー [keV], 透過率) 表
+        E (numpy.ndarray): X線エネルギー配列 [keV]
+    
+    Returns:
+        numpy.ndarray: 透過率
+        
+    Raises:
+        ValueError: エネルギーが透過率データの範囲外の場合
+    """
+    # 20 eV刻みの滑らかな表なので線形補間で十分（3次スプラインとの差は相対 5E-06 以下）
+    energy, transmittance = filter_table
+    if np.min(E) < energy[0] or np.max(E) > energy[-1]:
+        raise ValueError(
+            "エネルギー範囲 {:.3f} - {:.3f} keV がフィルターデータの範囲 "
+            "({:.3f} - {:.3f} keV) を超えています".format(np.min(E), np.max(E), energy[0], energy[-1])
+        )
+    return np.interp(E, energy, transmittance)
+
 def get_user_input():
     """ユーザーからの入力取得
     
@@ -91,10 +171,16 @@ def load_experimental_data(shot_num, file_path):
         file_path (str): データファイルパス
     
     Returns:
-        numpy.ndarray: IPスキャンデータ
+        tuple: (position, intensity) - IP上の位置 [cm] と強度 [PSL] の1次元配列
     """
-    return np.genfromtxt('{}.csv'.format(file_path), delimiter=',', 
-                        skip_header=1, skip_footer=0, autostrip=True)
+    # 欠損値処理の不要な2列の数値CSVなので、C実装のnp.loadtxtで高速に読み込む
+    data = np.loadtxt('{}.csv'.format(file_path), delimiter=',',
+                      skiprows=1, usecols=(0, 1), ndmin=2)
+    
+    # 後段の演算が連続メモリアクセスになるよう、列ごとに連続した1次元配列へ分ける
+    position = np.ascontiguousarray(data[:,0])
+    intensity = np.ascontiguousarray(data[:,1])
+    return position, intensity
 
 def setup_calibration_references():
     """キャリブレーション用基準線の設定
@@ -102,23 +188,15 @@ def setup_calibration_references():
     Returns:
         tuple: (E_def, theta_def, place) - 基準エネルギー、ブラッグ角、位置
     """
-    # キャリブレーション用の基準線のエネルギー [keV]
-    E_def = np.array([8.048, 8.391012])
-    
-    # 基準線のブラッグ角を計算 [rad]
-    # ブラッグの式: nλ = 2d sinθ より θ = arcsin(12.3984/(2d*E))
-    theta_def = np.arcsin(12.3984/(2.0 * D_HOPG * E_def))
-    
-    # 基準線のIP上での位置 [cm] - デフォルト値
-    place = np.array([1.005, 1.52])
-    
-    return E_def, theta_def, place
+    # 基準値は定数なので、モジュール読み込み時に一度だけ計算したものを返す
+    return E_DEF, THETA_DEF, PLACE
 
-def interactive_calibration_selection(data, E_def):
+def interactive_calibration_selection(position, intensity, E_def):
     """対話的なキャリブレーション基準線位置選択
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        position (numpy.ndarray): IP上の位置 [cm]
+        intensity (numpy.ndarray): IPの強度 [PSL]
         E_def (numpy.ndarray): 基準エネルギー配列
     
     Returns:
@@ -138,13 +216,16 @@ def interactive_calibration_selection(data, E_def):
     fig, ax = plt.subplots(figsize=(12, 8))
     
     # 生データをプロット
-    ax.plot(data[:,0], data[:,1], 'b-', linewidth=2, label='IP Scan Data')
+    ax.plot(position, intensity, 'b-', linewidth=2, label='IP Scan Data')
     ax.set_xlabel('Position [cm]', fontsize=14)
     ax.set_ylabel('Intensity [PSL]', fontsize=14)
     ax.set_title('Select Calibration Reference Positions\nClick to place, then drag to fine-tune positions', fontsize=16)
     ax.grid(True, alpha=0.3)
     ax.legend()
     
+    # ラベル表示の高さ基準（ドラッグ中に毎回データ全体を走査しないよう1回だけ計算）
+    y_max = np.max(intensity)
+    
     # 選択された位置を保存するリスト
     selected_positions = []
     vertical_lines = []
@@ -200,7 +281,6 @@ def interactive_calibration_selection(data, E_def):
             self.line.set_xdata([new_x, new_x])
             
             # テキストの位置を更新
-            y_max = np.max(data[:,1])
             self.text.set_position((new_x, y_max * 0.9))
             self.text.set_text(f'{E_def[self.index]:.3f} keV\n{new_x:.3f} cm')
             
@@ -245,7 +325,6 @@ def interactive_calibration_selection(data, E_def):
             vertical_lines.append(line)
             
             # テキスト表示
-            y_max = np.max(data[:,1])
             text = ax.text(x_pos, y_max * 0.9, f'{E_def[len(selected_positions)-1]:.3f} keV\n{x_pos:.3f} cm', 
                           ha='center', va='top', fontsize=11, 
                           bbox=dict(boxstyle='round,pad=0.3', facecolor='yellow', alpha=0.8))
@@ -337,71 +416,73 @@ def calculate_calibration_parameters(E_def, theta_def, place):
         numpy.ndarray: キャリブレーションパラメータ s
     """
     # 基準線の位置から座標変換パラメータを決定
-    # 連立一次方程式を解いて、IP座標からブラッグ角への変換係数を求める
-    left = [[1, np.tan(theta_def[0])],
-            [1, np.tan(theta_def[1])]]
-    
-    right = [50 * np.tan(theta_def[0]) + place[0] - 13, 
-             50 * np.tan(theta_def[1]) + place[1] - 13]
-    
-    # 連立方程式の解を求める
-    s = solve(left, right)
-    
-    return s
+    # 連立一次方程式 s[0] + tanθ_i·s[1] = 50·tanθ_i + place_i - 13 (i = 0, 1) を解いて、
+    # IP座標からブラッグ角への変換係数を求める
+    # 要素は2つだけなので、ufuncを経由せずmath.tanでスカラーとして計算する
+    tan0 = math.tan(theta_def[0])
+    tan1 = math.tan(theta_def[1])
+    right0 = 50 * tan0 + place[0] - 13
+    right1 = 50 * tan1 + place[1] - 13
+    
+    # 2元連立方程式なのでLAPACK（numpy.linalg.solve）を使わず直接解く
+    s1 = (right1 - right0) / (tan1 - tan0)
+    s0 = right0 - tan0 * s1
+    
+    return np.array([s0, s1])
 
-def convert_position_to_energy(data, s):
+def convert_position_to_energy(position, s):
     """IP上の位置座標からエネルギーへの変換
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        position (numpy.ndarray): IP上の位置 [cm]
         s (numpy.ndarray): キャリブレーションパラメータ
     
     Returns:
-        tuple: (E, theta_rad, theta_deg) - エネルギー、ブラッグ角
+        numpy.ndarray: エネルギー [keV]
     """
-    # IP上の位置座標からブラッグ角への変換
-    theta_rad = np.arctan((13 + s[0] - data[:,0])/(50 - s[1]))
-    theta_deg = theta_rad * 180 / np.pi  # 度に変換
+    # IP上の位置座標からブラッグ角の正接 u = tanθ への変換
+    u = (13 + s[0] - position)/(50 - s[1])
     
     # ブラッグの式を用いてエネルギーを計算 [keV]
     # E = hc/λ = 12.3984 / (2d sinθ)
-    E = 12.3984 / (2 * D_HOPG * np.sin(theta_rad))
+    # sin(arctan(u)) = u/√(1+u²) を使い、sinの評価を平方根1回で置き換える
+    E = BRAGG_CONST * np.sqrt(1 + u*u) / u
     
-    return E, theta_rad, theta_deg
+    return E
 
-def calculate_energy_resolution(s):
-    """エネルギー分解能計算関数の生成
+def calculate_energy_resolution(position, s, E=None):
+    """エネルギー分解能 dE/dx の計算
     
     Args:
+        position (numpy.ndarray): IP上の位置 [cm]
         s (numpy.ndarray): キャリブレーションパラメータ
+        E (numpy.ndarray, optional): convert_position_to_energyで計算済みのエネルギー [keV]
     
     Returns:
-        function: dE/dx計算関数
+        numpy.ndarray: 各データ点でのエネルギー分解能 dE/dx [keV/cm]
     """
-    def dEdx(x):
-        a = 12.3984  # hc [keV·Å]
-        b = 13 + s[0]  # 変換パラメータ
-        c = 50 - s[1]   # 変換パラメータ
-        theta = np.arctan((b-x)/c)
-        
-        # dθ/dx の計算
-        def dtdx(x):
-            return -c/(c**2 + (b - x)**2)
-        
-        # dE/dx = (∂E/∂θ) × (∂θ/∂x)
-        return (a/(2*D_HOPG)) * (2 * np.cos(theta))/(-1 + np.cos(2*theta)) * dtdx(x)
-    
-    return dEdx
+    b = 13 + s[0]  # 変換パラメータ
+    c = 50 - s[1]  # 変換パラメータ
+    
+    # ブラッグ角の正接 u = tanθ = (b-x)/c
+    u = (b - position) / c
+    if E is None:
+        E = BRAGG_CONST * np.sqrt(1 + u*u) / u
+    
+    # E = (hc/2d)·√(1+u²)/u を微分すると、du/dx = -1/c より
+    #   dE/dx = (hc/2d) / (c·u²·√(1+u²)) = E / (c·u·(1+u²))
+    # となり、計算済みのEを使えば平方根も不要になる
+    return E / (c * u * (1 + u*u))
 
-def convert_intensity_to_photon(data, E, t, dEdx_func, filter1, filter2):
+def convert_intensity_to_photon(intensity, E, t, dEdx, filter1, filter2):
     """IPの生データを絶対フォトン数密度に変換
     
     Args:
-        data (numpy.ndarray): IPスキャンデータ
+        intensity (numpy.ndarray): IPの強度 [PSL]
         E (numpy.ndarray): エネルギー配列
         t (float): 時間遅延
-        dEdx_func (function): エネルギー分解能関数
-        filter1, filter2: フィルター透過率関数
+        dEdx (numpy.ndarray): 各データ点でのエネルギー分解能 dE/dx [keV/cm]
+        filter1, filter2: フィルター透過率表（load_filter_dataの戻り値）
     
     Returns:
         numpy.ndarray: 絶対フォトン数密度
@@ -409,12 +490,19 @@ def convert_intensity_to_photon(data, E, t, dEdx_func, filter1, filter2):
     # 結晶反射率
     crystal_reflectivity = 5E-08
     
-    # 各種補正を適用（結晶反射率を含む）
-    correction_factor = (ip_time_correction(t) * ip_energy_correction(E) * 
-                        0.0025 * dEdx_func(data[:,0]) * filter1(E) * filter2(E) * 
-                        crystal_reflectivity)
+    # スカラーの補正係数（時間補正、0.0025、結晶反射率）は先にまとめておく
+    scalar_factor = ip_time_correction(t) * 0.0025 * crystal_reflectivity
     
-    return data[:,1] * 1000 / correction_factor
+    # 配列の補正係数は1つのバッファにインプレースで掛け合わせ、中間配列を作らない
+    correction_factor = ip_energy_correction(E)
+    correction_factor *= dEdx
+    correction_factor *= filter_transmittance(filter1, E)
+    correction_factor *= filter_transmittance(filter2, E)
+    correction_factor *= scalar_factor
+    
+    Photon = intensity * 1000
+    Photon /= correction_factor
+    return Photon
 
 def ensure_directory_exists(directory):
     """ディレクトリが存在しない場合は作成する
@@ -422,13 +510,15 @@ def ensure_directory_exists(directory):
     Args:
         directory (str): 作成するディレクトリのパス
     """
-    if not os.path.exists(directory):
-        try:
-            os.makedirs(directory)
-            print(f"   - ディレクトリを作成しました: {directory}")
-        except OSError as e:
-            print(f"   - ディレクトリ作成エラー: {e}")
-            raise
+    # 存在確認とは別にstatせず、作成を試みて既存の場合の例外を無視する
+    try:
+        os.makedirs(directory)
+        print(f"   - ディレクトリを作成しました: {directory}")
+    except FileExistsError:
+        pass
+    except OSError as e:
+        print(f"   - ディレクトリ作成エラー: {e}")
+        raise
 
 def save_data(E, Photon, shot_num):
     """データの保存
@@ -442,8 +532,10 @@ def save_data(E, Photon, shot_num):
     ensure_directory_exists('data')
     
     # 絶対フォトン数スペクトラムデータをCSVファイルに保存
-    out_raw = np.array([E, Photon]).T
-    np.savetxt('data/HOPG_{}.csv'.format(shot_num), out_raw, delimiter=',')
+    # 2×N配列を作って転置するのではなく、N×2配列を直接作成する
+    out_raw = np.column_stack((E, Photon))
+    # 有効数字7桁で十分なため、既定の '%.18e' より短い書式で書き出す（ファイルサイズ・書き込み時間を削減）
+    np.savetxt('data/HOPG_{}.csv'.format(shot_num), out_raw, delimiter=',', fmt='%.6e')
 
 def plot_spectrum(E, Photon, shot_num):
     """絶対フォトン数スペクトラムのグラフ作成と保存
@@ -453,48 +545,38 @@ def plot_spectrum(E, Photon, shot_num):
         Photon (numpy.ndarray): 絶対フォトン数密度
         shot_num (str): ショット番号
     """
+    from matplotlib import rc_context
+    from matplotlib.figure import Figure
+    
     # データフォルダの存在確認・作成
     ensure_directory_exists('data')
     
-    # フォントとグラフの設定
-    plt.rcParams.update({
-        'font.family': 'sans-serif',
-        'font.sans-serif': ['Helvetica', 'Arial', 'DejaVu Sans'],
-        'font.size': 14,
-        'axes.linewidth': 1.5,
-        'axes.labelsize': 16,
-        'axes.titlesize': 18,
-        'xtick.labelsize': 14,
-        'ytick.labelsize': 14,
-        'legend.fontsize': 12,
-        'figure.dpi': 300
-    })
-    
-    fig, ax = plt.subplots(figsize=(10, 6))
-    
-    # スペクトラムをプロット（見やすいスタイル）
-    ax.plot(E, Photon, linewidth=2, color='blue', alpha=0.8)
-    
-    # 軸ラベルとフォーマット設定
-    ax.set_xlabel("Energy [keV]", fontweight='bold')
-    ax.set_ylabel("Absolute Photon Number [Photon/str/keV]", fontweight='bold')
-    ax.ticklabel_format(style="sci", axis="y", scilimits=(0,0))
-    
-    # グリッドを追加して見やすくする
-    ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
-    
-    # 軸の範囲を自動調整
-    ax.set_xlim(np.min(E), np.max(E))
-    ax.set_ylim(0, np.max(Photon) * 1.1)
-    
-    # レイアウトを調整
-    plt.tight_layout()
-    
-    # PDFとして保存
-    plt.savefig("data/HOPG_{}.pdf".format(shot_num), bbox_inches='tight', pad_inches=0.1)
-    
-    # メモリを解放
-    plt.close(fig)
+    # フォントとグラフの設定（rcParamsはこの関数内でのみ一時的に適用）
+    with rc_context(SPECTRUM_PLOT_STYLE):
+        # ファイル保存のみで画面表示はしないため、pyplotの状態管理を介さずFigureを直接作成する
+        fig = Figure(figsize=(10, 6))
+        ax = fig.add_subplot(111)
+        
+        # スペクトラムをプロット（見やすいスタイル）
+        ax.plot(E, Photon, linewidth=2, color='blue', alpha=0.8)
+        
+        # 軸ラベルとフォーマット設定
+        ax.set_xlabel("Energy [keV]", fontweight='bold')
+        ax.set_ylabel("Absolute Photon Number [Photon/str/keV]", fontweight='bold')
+        ax.ticklabel_format(style="sci", axis="y", scilimits=(0,0))
+        
+        # グリッドを追加して見やすくする
+        ax.grid(True, alpha=0.3, linestyle='-', linewidth=0.5)
+        
+        # 軸の範囲を自動調整
+        ax.set_xlim(np.min(E), np.max(E))
+        ax.set_ylim(0, np.max(Photon) * 1.1)
+        
+        # レイアウトを調整
+        fig.tight_layout()
+        
+        # PDFとして保存
+        fig.savefig("data/HOPG_{}.pdf".format(shot_num), bbox_inches='tight', pad_inches=0.1)
 
 def extract_shot_number_from_filename(file_path):
     """ファイル名からショット番号を抽出する
@@ -512,9 +594,7 @@ def extract_shot_number_from_filename(file_path):
     filename = os.path.splitext(os.path.basename(file_path))[0]
     
     # GXIIレーザー（Gから始まる）またはLFEXレーザー（Lから始まる）のショット番号を検索
-    # パターン: _G##### または _L##### （#は数字）
-    pattern = r'_([GL]\d+)_'
-    match = re.search(pattern, filename)
+    match = _SHOT_RE.search(filename)
     
     if match:
         return match.group(1)
@@ -549,6 +629,9 @@ def get_file_path_gui():
     Returns:
         str: 選択されたデータファイルのパス（拡張子なし）、キャンセルの場合はNone
     """
+    import tkinter as tk
+    from tkinter import filedialog
+    
     # Tkinterのルートウィンドウを作成（非表示）
     root = tk.Tk()
     root.withdraw()  # メインウィンドウを非表示にする
@@ -621,7 +704,7 @@ def validate_data_file(file_path):
         bool: ファイルが存在する場合True
     """
     csv_file_path = file_path + '.csv'
-    return os.path.exists(csv_file_path)
+    return os.path.isfile(csv_file_path)
 
 def update_analysis_script_calibration(s, shot_num, file_path):
     """energy_conversion_HOPG.pyのキャリブレーションパラメータを直接更新
@@ -631,9 +714,6 @@ def update_analysis_script_calibration(s, shot_num, file_path):
         shot_num (str): ショット番号
         file_path (str): データファイルパス
     """
-    import datetime
-    import re
-    
     # 現在の日時を取得
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y年%m月%d日 %H時%M分%S秒")
@@ -649,7 +729,6 @@ def update_analysis_script_calibration(s, shot_num, file_path):
         with open(script_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-       
         # キャリブレーションパラメータの行を探して置換
         # 過去の更新歴を含むすべてのパターンに対応
         
@@ -657,29 +736,17 @@ def update_analysis_script_calibration(s, shot_num, file_path):
             s[0], s[1], timestamp, shot_num
         )
         
-        # パターン1: 基本的なコメント付きsの行を探す（更新歴があってもなくても）
-        pattern1 = r'(\s+# 事前に決定されたキャリブレーションパラメータ.*?\n)(\s+s = \[.*?\].*?\n)'
-        
-        def replace_calibration_params(match):
-            comment_line = match.group(1)
-            return comment_line + new_s_line + '\n'
-        
-        new_content = re.sub(pattern1, replace_calibration_params, content, flags=re.DOTALL)
-        
-        # パターン1で見つからない場合、より広範囲なパターンで探す
-        if new_content == content:
-            # sの行（コメント付き）を直接探す
-            pattern2 = r'(\s+s = \[.*?\].*?(?:#.*?)?)\n'
-            new_content = re.sub(pattern2, '    s = [{:.8f}, {:.8f}]  # 自動更新: {} (ショット: {})\n'.format(
-                s[0], s[1], timestamp, shot_num
-            ), content)
+        # コメント付きsの行を探して置換（更新歴があってもなくても、最初の1箇所のみ）
+        new_content, count = _CAL_LINE_RE.subn(
+            lambda match: match.group(1) + new_s_line, content, count=1
+        )
         
-        # パターン2でも見つからない場合、行ベースで探す
-        if new_content == content:
+        # 見つからない場合、行ベースで探す
+        if count == 0:
             lines = content.split('\n')
             for i, line in enumerate(lines):
                 # sの定義行を探す（コメントがあってもなくても）
-                if re.match(r'\s*s\s*=\s*\[', line):
+                if _S_LINE_RE.match(line):
                     # 前の数行にキャリブレーション関連のコメントがあるか確認
                     context_start = max(0, i-5)
                     context_lines = lines[context_start:i+1]
@@ -687,16 +754,26 @@ def update_analysis_script_calibration(s, shot_num, file_path):
                     
                     if 'キャリブレーション' in context_text or 'calibrat' in context_text.lower():
                         # 見つかった行を新しい行で完全に置換
-                        lines[i] = '    s = [{:.8f}, {:.8f}]  # 自動更新: {} (ショット: {})'.format(
-                            s[0], s[1], timestamp, shot_num
-                        )
+                        lines[i] = new_s_line
                         new_content = '\n'.join(lines)
                         break
         
-        # ファイルの更新
+        # ファイルの更新（変更がある場合のみバックアップを作成する）
         if new_content != content:
-            with open(script_path, 'w', encoding='utf-8') as f:
-                f.write(new_content)
+            # 更新前のスクリプトのバックアップ（内容の読み書きはせずOSのファイルコピーに任せる）
+            backup_path = '{}.backup_{}'.format(script_path, now.strftime("%Y%m%d_%H%M%S"))
+            shutil.copy2(script_path, backup_path)
+            
+            # 一時ファイルに書き込んでから置き換え、書き込み途中で失敗してもスクリプトが壊れないようにする
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(script_path)), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(new_content)
+                shutil.copymode(script_path, tmp_path)
+                os.replace(tmp_path, script_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
             
             print("    - energy_conversion_HOPG.py を自動更新しました")
             print("    - バックアップ作成: {}".format(backup_path))
@@ -706,9 +783,6 @@ def update_analysis_script_calibration(s, shot_num, file_path):
             return True
         else:
             print("    - キャリブレーションパラメータの更新対象が見つかりませんでした")
-            # バックアップファイルを削除（変更がないため）
-            if os.path.exists(backup_path):
-                os.remove(backup_path)
             return False
             
     except Exception as e:
@@ -731,13 +805,11 @@ def extract_reading_time_from_filename(file_path):
     filename = os.path.basename(file_path)
     
     # _HOPG_XXXX パターンを検索（XXXXは4桁の数字）
-    pattern = r'_HOPG_(\d{4})'
-    match = re.search(pattern, filename)
+    match = _HOPG_TIME_RE.search(filename)
     
     if match:
-        time_str = match.group(1)
-        hours = int(time_str[:2])    # 最初の2桁が時間
-        minutes = int(time_str[2:])  # 残りの2桁が分
+        hours = int(match.group(1))    # 最初の2桁が時間
+        minutes = int(match.group(2))  # 残りの2桁が分
         
         # 時間と分の妥当性チェック
         if 0 <= hours <= 23 and 0 <= minutes <= 59:
@@ -747,6 +819,87 @@ def extract_reading_time_from_filename(file_path):
     else:
         raise ValueError("ファイル名にIP読み取り時刻（_HOPG_XXXX）が見つかりません")
 
+def load_shot_time_cache():
+    """ショット時刻キャッシュの読み込み
+    
+    Returns:
+        dict: ショット番号をキー、[時, 分] を値とする辞書（ファイルがない・壊れている場合は空）
+    """
+    try:
+        with open(SHOT_TIME_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except OSError:
+        return {}
+    except ValueError as e:
+        print("    - 注意: ショット時刻キャッシュが壊れているため使用しません: {}".format(e))
+        return {}
+
+def save_shot_time_cache(shot_num, hours, minutes):
+    """取得したショット時刻をキャッシュに追記する
+    
+    Args:
+        shot_num (str): ショット番号
+        hours (int): ショット時刻の時
+        minutes (int): ショット時刻の分
+    """
+    with _SHOT_TIME_CACHE_LOCK:
+        cache = load_shot_time_cache()
+        cache[shot_num] = [hours, minutes]
+        try:
+            ensure_directory_exists('data')
+            # 一時ファイルに書き込んでから置き換え、別プロセスとの同時書き込みや
+            # 書き込み途中の中断でキャッシュファイルが壊れないようにする
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(SHOT_TIME_CACHE_PATH), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(cache, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, SHOT_TIME_CACHE_PATH)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError as e:
+            # キャッシュは高速化のためだけなので、書き込めなくても解析は続行する
+            print("    - 注意: ショット時刻キャッシュを保存できませんでした: {}".format(e))
+
+def find_valid_time_after(text, pos):
+    """指定位置以降で最初の有効な時刻（0-23時、0-59分）を探す
+    
+    Args:
+        text (str): 検索対象の文字列
+        pos (int): 検索開始位置
+    
+    Returns:
+        tuple: (hours, minutes)、見つからない場合はNone
+    """
+    # 部分文字列を切り出さず指定位置から走査し、見つかった時点で打ち切る
+    for time_match in _TIME_RE.finditer(text, pos):
+        hours = int(time_match.group(1))
+        minutes = int(time_match.group(2))
+        
+        if 0 <= hours <= 23 and 0 <= minutes <= 59:
+            return hours, minutes
+    return None
+
+def get_http_session():
+    """ショット記録ページ取得用のHTTPセッションを返す
+    
+    スレッドごとに初回呼び出し時に作成し、以降は同じセッションを使うことで
+    複数ショットの取得時にTCP接続を再利用する。
+    
+    Returns:
+        requests.Session: User-Agentを設定したセッション
+    """
+    session = getattr(_HTTP_SESSION_LOCAL, 'session', None)
+    if session is None:
+        import requests
+        
+        session = requests.Session()
+        session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        _HTTP_SESSION_LOCAL.session = session
+    return session
+
 def fetch_shot_time_from_web(shot_num, laser_type):
     """Webページからショット時刻を取得する
     
@@ -757,7 +910,17 @@ def fetch_shot_time_from_web(shot_num, laser_type):
     Returns:
         tuple: (hours, minutes) - ショット時刻の時間と分、取得失敗時は (None, None)
     """
+    # 以前に取得済みのショットはWebにアクセスせずキャッシュから返す
+    cached = load_shot_time_cache().get(shot_num)
+    if cached is not None:
+        hours, minutes = cached
+        print("    - ✓ ショット時刻（キャッシュ）: {}時{}分".format(hours, minutes))
+        return hours, minutes
+    
     try:
+        # requestsがない環境でもバッチ解析全体を止めず、このショットの取得失敗として扱う
+        import requests
+        
         # ショット番号からGまたはLプレフィックスを除去
         shot_id = shot_num[1:] if shot_num.startswith(('G', 'L')) else shot_num
         
@@ -774,42 +937,25 @@ def fetch_shot_time_from_web(shot_num, laser_type):
         
         print("    - ショット時刻取得中: {}".format(url))
         
-        # Webページを取得
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
+        # Webページを取得（セッションを共有して接続を再利用する）
+        # ページは小さいため本文を最後まで読み、接続をセッションに戻して次のショットで再利用する
+        response = get_http_session().get(url, timeout=10)
         response.raise_for_status()
         
-        # HTMLを解析
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # HTMLから直接大文字のMAINを検索
+        # HTMLはパースせず、テキストから直接大文字のMAINを検索する
         html_content = response.text
         main_pos = html_content.find('MAIN')
         
         if main_pos != -1:
             print("    - 大文字MAIN発見（HTML直接検索）")
             
-            # MAINより後の部分で最初の時刻を探す
-            after_main = html_content[main_pos:]
-            time_pattern = r'(\d{1,2}):(\d{2})'
-            time_matches = re.findall(time_pattern, after_main)
-            
-            if time_matches:
-                print("    - MAIN後の時刻候補: {}".format(time_matches))
-                
-                # 最初の有効な時刻を使用（MAINの直後）
-                for time_match in time_matches:
-                    try:
-                        hours = int(time_match[0])
-                        minutes = int(time_match[1])
-                        
-                        if 0 <= hours <= 23 and 0 <= minutes <= 59:
-                            print("    - ✓ ショット時刻（MAIN直後）: {}時{}分".format(hours, minutes))
-                            return hours, minutes
-                    except ValueError:
-                        continue
+            # MAIN直後の有効な時刻を探す
+            shot_time = find_valid_time_after(html_content, main_pos)
+            if shot_time is not None:
+                hours, minutes = shot_time
+                print("    - ✓ ショット時刻（MAIN直後）: {}時{}分".format(hours, minutes))
+                save_shot_time_cache(shot_num, hours, minutes)
+                return hours, minutes
             
             # MAIN後に時刻が見つからない場合
             print("    - ✗ エラー: MAIN後に有効な時刻が見つかりませんでした")
@@ -821,6 +967,10 @@ def fetch_shot_time_from_web(shot_num, laser_type):
         print("    - 手動入力が必要です")
         return "MAIN_NOT_FOUND", None
             
+    except ImportError as e:
+        print("    - ✗ Webページ取得に必要なライブラリがありません: {}".format(e))
+        print("    - 手動入力が必要です")
+        return "IMPORT_ERROR", None
     except requests.exceptions.RequestException as e:
         print("    - ✗ Webページ取得エラー: {}".format(e))
         print("    - 手動入力が必要です")
@@ -830,13 +980,44 @@ def fetch_shot_time_from_web(shot_num, laser_type):
         print("    - 手動入力が必要です")
         return "UNKNOWN_ERROR", None
 
-def calculate_time_delay_auto(file_path, shot_num, laser_type):
+def fetch_shot_times_batch(shots, max_workers=8):
+    """複数ショットの時刻をWebから並列に取得する（バッチ解析の事前取得用）
+    
+    取得結果はキャッシュに保存されるため、その後のcalculate_time_delay_autoは
+    Webにアクセスせずに時刻を得られる。
+    
+    Args:
+        shots (list): (ショット番号, レーザータイプ) のリスト
+        max_workers (int): 同時に行うWebアクセスの最大数
+    
+    Returns:
+        dict: ショット番号をキー、fetch_shot_time_from_webの戻り値を値とする辞書
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    # キャッシュ済みのショットと重複を除き、未取得のショットだけをWebに問い合わせる
+    cache = load_shot_time_cache()
+    results = {shot_num: tuple(cache[shot_num]) for shot_num, _ in shots if shot_num in cache}
+    pending = list(dict.fromkeys(shot for shot in shots if shot[0] not in cache))
+    
+    if pending:
+        # 各ワーカースレッドはget_http_sessionで自分専用のセッションを使う
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = executor.map(lambda shot: fetch_shot_time_from_web(*shot), pending)
+            for (shot_num, _), result in zip(pending, fetched):
+                results[shot_num] = result
+    
+    return results
+
+def calculate_time_delay_auto(file_path, shot_num, laser_type, interactive=True, shot_time=None):
     """ファイル名とWebページから自動的に時間遅延を計算する
     
     Args:
         file_path (str): データファイルのパス
         shot_num (str): ショット番号
         laser_type (str): レーザータイプ
+        interactive (bool): Web取得に失敗した場合にショット時刻の手動入力を求めるか
+        shot_time (tuple): 取得済みのfetch_shot_time_from_webの戻り値、Noneの場合はWebから取得
     
     Returns:
         float: 時間遅延 [時間]、計算失敗時は None
@@ -847,22 +1028,27 @@ def calculate_time_delay_auto(file_path, shot_num, laser_type):
         read_hours, read_minutes = extract_reading_time_from_filename(file_path)
         print("    - IP読み取り時刻: {}時{}分".format(read_hours, read_minutes))
         
-        # 2. Webページからショット時刻を取得
-        print("    - Webページからショット時刻を取得中...")
-        shot_hours, shot_minutes = fetch_shot_time_from_web(shot_num, laser_type)
+        # 2. Webページからショット時刻を取得（事前取得済みの場合はその結果を使う）
+        if shot_time is None:
+            print("    - Webページからショット時刻を取得中...")
+            shot_time = fetch_shot_time_from_web(shot_num, laser_type)
+        shot_hours, shot_minutes = shot_time
         
         # エラー時の手動入力フォールバック
         if isinstance(shot_hours, str):  # エラーコードが返された場合
             print("    - ✗ 自動取得に失敗しました")
+            if not interactive:
+                # バッチ解析など対話できない場合は入力を待たずに失敗として返す
+                return None
             print("    - 手動でショット時刻を入力してください")
             
             while True:
                 try:
                     shot_time_input = input("    ショット時刻を入力 (HH:MM形式): ").strip()
-                    if re.match(r'^\d{1,2}:\d{2}$', shot_time_input):
-                        time_parts = shot_time_input.split(':')
-                        shot_hours = int(time_parts[0])
-                        shot_minutes = int(time_parts[1])
+                    time_match = _TIME_RE.fullmatch(shot_time_input)
+                    if time_match:
+                        shot_hours = int(time_match.group(1))
+                        shot_minutes = int(time_match.group(2))
                         
                         if 0 <= shot_hours <= 23 and 0 <= shot_minutes <= 59:
                             print("    - 手動入力されたショット時刻: {}時{}分".format(shot_hours, shot_minutes))
@@ -871,7 +1057,7 @@ def calculate_time_delay_auto(file_path, shot_num, laser_type):
                             print("    - 無効な時刻です。0-23時、0-59分の範囲で入力してください")
                     else:
                         print("    - HH:MM形式で入力してください（例：14:20）")
-                except (ValueError, KeyboardInterrupt):
+                except ValueError:
                     print("    - 入力が無効です。再度入力してください")
         
         if shot_hours is None or shot_minutes is None:
@@ -966,8 +1152,8 @@ def main():
         
         # 4. 実験データの読み込み
         print("\n4. 実験データの読み込み中...")
-        data = load_experimental_data(shot_num, file_path)
-        print("   - データ点数: {} 点".format(len(data)))
+        position, intensity = load_experimental_data(shot_num, file_path)
+        print("   - データ点数: {} 点".format(len(position)))
         
         # 5. キャリブレーション基準線の設定
         print("\n5. キャリブレーション基準線の設定...")
@@ -975,7 +1161,7 @@ def main():
         
         # インタラクティブモードで位置を選択
         print("   - グラフ上で基準線位置を選択してください")
-        place = interactive_calibration_selection(data, E_def)
+        place = interactive_calibration_selection(position, intensity, E_def)
         
         if place is None:
             print("\nエラー: キャリブレーション位置の選択に失敗しました。")
@@ -994,20 +1180,25 @@ def main():
         
         # 7. エネルギー変換
         print("\n7. エネルギー変換処理中...")
-        E, theta_rad, theta_deg = convert_position_to_energy(data, s)
+        E = convert_position_to_energy(position, s)
         print("   - エネルギー範囲: {:.2f} - {:.2f} keV".format(np.min(E), np.max(E)))
-        print("   - ブラッグ角範囲: {:.2f} - {:.2f} 度".format(np.min(theta_deg), np.max(theta_deg)))
+        # ブラッグ角はエネルギーの単調減少関数なので、表示用に両端の2点だけ sinθ = hc/(2dE) から求める
+        print("   - ブラッグ角範囲: {:.2f} - {:.2f} 度".format(
+            math.degrees(math.asin(BRAGG_CONST / np.max(E))), math.degrees(math.asin(BRAGG_CONST / np.min(E)))))
         
-        # 8. エネルギー分解能関数の生成
-        print("\n8. エネルギー分解能関数の生成...")
-        dEdx_func = calculate_energy_resolution(s)
+        # 8. エネルギー分解能 dE/dx の計算
+        print("\n8. エネルギー分解能 dE/dx の計算...")
+        dEdx = calculate_energy_resolution(position, s, E)
         
         # 9. 絶対フォトン数密度への変換
         print("\n9. 絶対フォトン数密度への変換処理中...")
-        Photon = convert_intensity_to_photon(data, E, time_delay, dEdx_func, filter1, filter2)
+        Photon = convert_intensity_to_photon(intensity, E, time_delay, dEdx, filter1, filter2)
         print("   - 結晶反射率: 5E-08 適用済み")
         print("   - 最大絶対フォトン数密度: {:.2e} photons/keV".format(np.max(Photon)))
-        print("   - 積分フォトン数: {:.2e} photons".format(np.trapz(Photon, E)))
+        # 台形則による積分（np.trapzはNumPy 2.0で非推奨となり後に削除され、代わりのnp.trapezoidは
+        # NumPy 1.x にないため、どちらの版でも動くよう内積で計算する）
+        total_photon = np.dot(0.5 * (Photon[:-1] + Photon[1:]), np.diff(E))
+        print("   - 積分フォトン数: {:.2e} photons".format(total_photon))
         
         # 10. データの保存とグラフ作成
         print("\n10. データの保存とグラフ作成中...")
@@ -1019,7 +1210,7 @@ def main():
         # 11. キャリブレーションパラメータの表示
         print("\n11. キャリブレーション結果")
         print("    - 計算されたキャリブレーションパラメータ:")
-        pprint.pprint(s)
+        print("      s = [{:.6f}, {:.6f}]".format(s[0], s[1]))
         print("    - これらの値を energy_conversion_HOPG.py で使用してください")
         
         # 12. energy_conversion_HOPG.py のキャリブレーションパラメータを自動更新